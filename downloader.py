@@ -7,6 +7,8 @@ import httpx
 
 from data import USER_AGENTS, URL
 from extractor import extract_pagination_links
+from logger_config import logger
+from tracing import tracer
 
 
 
@@ -30,8 +32,9 @@ async def download_and_save_page(session: httpx.AsyncClient, url: str, output_fi
     }
 
     try:
-        response = await session.get(url, headers=headers, follow_redirects=True)
-        response.raise_for_status()
+        with tracer.span("fetch", url=url):
+            response = await session.get(url, headers=headers, follow_redirects=True)
+            response.raise_for_status()
 
         # Create the pages directory if it doesn't exist
         PAGES_DIR.mkdir(exist_ok=True)
@@ -39,13 +42,13 @@ async def download_and_save_page(session: httpx.AsyncClient, url: str, output_fi
         # Save the content to a file in the pages directory
         output_path = PAGES_DIR / output_file
         output_path.write_text(response.text, encoding="utf-8")
-        print(f"Page content saved to {output_path.absolute()}")
+        logger.info("Page content saved to %s", output_path.absolute())
         return str(output_path.absolute())
 
     except httpx.HTTPStatusError as e:
-        print(f"HTTP error occurred: {e}")
+        logger.error("HTTP error occurred: %s", e)
     except httpx.RequestError as e:
-        print(f"An error occurred while requesting {e.request.url!r}.")
+        logger.error("An error occurred while requesting %r.", e.request.url)
 
     return ""
 
@@ -46,6 +46,27 @@ def extract_area_from_parameters(parameters_text: str) -> Optional[float]:
     return None
 
 
+def extract_price_value(price_text: Optional[str]) -> Optional[float]:
+    """
+    Извлекает числовое значение цены из строки.
+    - "1 711 р." -> 1711.0
+    - "555.03 $*" -> 555.03
+    - "24 p. / м²" -> 24.0
+    """
+    if not price_text:
+        return None
+
+    # Убираем пробелы-разделители тысяч (в том числе неразрывные)
+    compact = re.sub(r'[\s  ]+', '', price_text).replace(',', '.')
+    match = re.search(r'\d+(?:\.\d+)?', compact)
+    if not match:
+        return None
+    try:
+        return float(match.group(0))
+    except ValueError:
+        return None
+
+
 def extract_all_listings_data(html_content: str) -> List[Dict[str, str]]:
     soup = BeautifulSoup(html_content, 'html.parser')
     listings = soup.find_all('section')
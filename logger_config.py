@@ -1,13 +1,43 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import os
 
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Puts records on the queue as is, so message formatting happens in the
+    listener thread instead of on the polling loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Appends fields passed via `extra=` to the message as JSON,
+    e.g. logger.info("New offer found: %s", offer_id, extra={"offer": offer}).
+    """
+
+    _standard_attributes = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        extra = {key: value for key, value in vars(record).items() if key not in self._standard_attributes}
+        if extra:
+            message += " " + json.dumps(extra, ensure_ascii=False, default=str)
+        return message
+
+
 # Create a logger
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 # Create formatter
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+formatter = StructuredFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 # Console handler
 console_handler = logging.StreamHandler()
@@ -27,9 +57,13 @@ error_file_handler = RotatingFileHandler(
 error_file_handler.setLevel(logging.ERROR)
 error_file_handler.setFormatter(formatter)
 
-# Add handlers to logger
-logger.addHandler(console_handler)
-logger.addHandler(error_file_handler)
+# Handlers run in a background listener thread; the logger itself only enqueues records
+log_queue = queue.SimpleQueue()
+queue_listener = QueueListener(log_queue, console_handler, error_file_handler, respect_handler_level=True)
+queue_listener.start()
+atexit.register(queue_listener.stop)
+
+logger.addHandler(LazyQueueHandler(log_queue))
 
 # Optionally, you can disable propagation to prevent double logging if this logger is a child of another logger
 logger.propagate = False
\ No newline at end of file
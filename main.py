@@ -2,7 +2,7 @@ import asyncio
 import json
 import os
 import random
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 import httpx
 from pathlib import Path
@@ -12,10 +12,13 @@ from dotenv import load_dotenv
 from downloader import download_all_pages
 from extractor import extract_all_listings_data
 from logger_config import logger
+from market_stats import MarketStatistics, get_stats_file
 from notifications import TelegramNotification, EmailNotification
+from photos import get_photo_cache
 from schema import ListingItem
 
 from services import update_offers
+from tracing import tracer, profiler
 
 # Constants for timing
 MIN_DELAY = 55  # minimum delay in seconds
@@ -25,7 +28,7 @@ ERROR_COOLDOWN = 300  # 5 minutes cooldown after consecutive errors
 load_dotenv()
 
 
-async def start_parsing(storage_file: str = None) -> List[Dict[str, str]]:
+async def start_parsing(storage_file: str = None, market_stats: Optional[MarketStatistics] = None) -> List[Dict[str, str]]:
     # Get storage file path from environment or use default
     if storage_file is None:
         storage_file = os.getenv("STORAGE_FILE", "listings_data.json")
@@ -40,7 +43,13 @@ async def start_parsing(storage_file: str = None) -> List[Dict[str, str]]:
         # If storage file exists, load data from it
         with open(storage_path, 'r', encoding='utf-8') as f:
             existing_data = json.load(f)
-        logger.info(f"Loaded {len(existing_data)} existing listings from {storage_path}")
+        logger.info("Loaded %d existing listings from %s", len(existing_data), storage_path)
+
+    # Build market statistics once from the stored history if there is no stats file yet
+    if market_stats is not None and not market_stats.exists:
+        for item in existing_data:
+            market_stats.add(ListingItem.from_dict(item))
+        logger.info("Built market statistics from %d stored listings", len(existing_data))
 
     # Always download pages and extract data to check for new listings
     async with httpx.AsyncClient(timeout=30.0, verify=True, http2=True) as session:
@@ -67,19 +76,35 @@ async def start_parsing(storage_file: str = None) -> List[Dict[str, str]]:
         if unique_id not in existing_set:
             new_listings.append(listing)
             existing_data.append(listing)
-            logger.info(f"Found new listing: {listing.get('address', 'N/A')}")
+            if market_stats is not None:
+                market_stats.add(ListingItem.from_dict(listing))
+            logger.info("Found new listing: %s", listing.get('address', 'N/A'))
 
     # Save updated data to storage file
     with open(storage_path, 'w', encoding='utf-8') as f:
         json.dump(existing_data, f, ensure_ascii=False, indent=2)
 
-    logger.info(f"Updated {storage_path} with {len(new_listings)} new listings. Total: {len(existing_data)}")
+    if market_stats is not None:
+        market_stats.save()
+
+    logger.info("Updated %s with %d new listings. Total: %d", storage_path, len(new_listings), len(existing_data))
     return existing_data
 
 
 async def main():
+    # kill -USR1 <pid> profiles the next cycle(s)
+    profiler.install_signal_handler()
+
+    # Incremental price-per-m² statistics used for market context in alerts
+    market_stats = MarketStatistics(get_stats_file())
+    market_stats.load()
+
+    # Prefetched listing photos and Telegram file_ids, so repeated sends skip the upload
+    photo_cache = get_photo_cache()
+    photo_cache.load()
+
     # Initial parsing
-    await start_parsing()
+    await start_parsing(market_stats=market_stats)
 
     error_count = 0
     
@@ -92,7 +117,12 @@ async def main():
         bot_token = os.getenv("BOT_TOKEN")
         chat_id = os.getenv("CHAT_ID")
         if bot_token and chat_id:
-            telegram_notification = TelegramNotification(bot_token=bot_token, chat_id=chat_id)
+            telegram_notification = TelegramNotification(
+                bot_token=bot_token,
+                chat_id=chat_id,
+                market_stats=market_stats,
+                photo_cache=photo_cache
+            )
             logger.info("Telegram notifications enabled")
         else:
             logger.warning("Telegram notifications disabled: missing BOT_TOKEN or CHAT_ID")
@@ -121,36 +151,58 @@ async def main():
     async with httpx.AsyncClient(timeout=30.0, verify=True, http2=True) as session:
         while True:
             try:
-                logger.info("Updating offers...")
-                new_offers = await update_offers(session)
-                
-                # Send notifications for new offers
-                for offer in new_offers:
-                    offer = ListingItem.from_dict(offer)
-                    notification_tasks = []
-                    
-                    if telegram_notification:
-                        notification_tasks.append(telegram_notification.send_notification(offer))
-                    
-                    if email_notification:
-                        notification_tasks.append(email_notification.send_notification(offer))
-                    
-                    if notification_tasks:
-                        await asyncio.gather(*notification_tasks)
-
-                logger.info(f"Found {len(new_offers)} new offers.")
+                with profiler.cycle(), tracer.cycle():
+                    logger.info("Updating offers...")
+                    new_offers = await update_offers(session)
+
+                    if telegram_notification and new_offers:
+                        # Offers are already saved as seen, so a prefetch failure must not skip their notifications
+                        try:
+                            with tracer.span("prefetch.photos", photos=len(new_offers)):
+                                await photo_cache.prefetch(session, [offer.get("photo_url") for offer in new_offers])
+                        except Exception as e:
+                            logger.error("Photo prefetch failed, sending photos by URL: %s", e)
+
+                    # Send notifications for new offers
+                    for offer in new_offers:
+                        offer = ListingItem.from_dict(offer)
+                        notification_tasks = []
+
+                        if telegram_notification:
+                            notification_tasks.append(tracer.wrap(
+                                "notify.telegram", telegram_notification.send_notification(offer), offer_id=offer.id
+                            ))
+
+                        if email_notification:
+                            notification_tasks.append(tracer.wrap(
+                                "notify.email", email_notification.send_notification(offer), offer_id=offer.id
+                            ))
+
+                        if notification_tasks:
+                            await asyncio.gather(*notification_tasks)
+
+                        # Add the offer only after notifying so it is compared against the existing market
+                        market_stats.add(offer)
+
+                    if new_offers:
+                        with tracer.span("persist.stats"):
+                            market_stats.save()
+                        with tracer.span("persist.photos"):
+                            photo_cache.save()
+
+                logger.info("Found %d new offers.", len(new_offers))
                 
                 # Reset error count on successful update
                 error_count = 0
 
                 # Random delay before next update
                 delay = random.uniform(MIN_DELAY, MAX_DELAY)
-                logger.info(f"Waiting for {delay:.2f} seconds before next update.")
+                logger.info("Waiting for %.2f seconds before next update.", delay)
                 await asyncio.sleep(delay)
 
             except Exception as e:
                 error_count += 1
-                logger.error(f"Error occurred: {e}")
+                logger.error("Error occurred: %s", e)
                 
                 if error_count >= MAX_CONSECUTIVE_ERRORS:
                     error_message = f"Too many consecutive errors ({error_count}). Last error: {str(e)}"
@@ -167,13 +219,13 @@ async def main():
                     if error_tasks:
                         await asyncio.gather(*error_tasks)
                     
-                    logger.warning(f"Cooling down for {ERROR_COOLDOWN} seconds.")
+                    logger.warning("Cooling down for %d seconds.", ERROR_COOLDOWN)
                     await asyncio.sleep(ERROR_COOLDOWN)
                     error_count = 0
                 else:
                     # Shorter delay on error, but still random
                     delay = random.uniform(MIN_DELAY / 2, MAX_DELAY / 2)
-                    logger.info(f"Retrying in {delay:.2f} seconds.")
+                    logger.info("Retrying in %.2f seconds.", delay)
                     await asyncio.sleep(delay)
 
 if __name__ == "__main__":
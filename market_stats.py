@@ -0,0 +1,342 @@
+import json
+import os
+import re
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Dict, Optional, Any, Tuple
+
+from extractor import extract_area_from_parameters, extract_price_value
+from logger_config import logger
+from schema import ListingItem
+
+# Границы диапазонов площади в м²: [0, 50), [50, 100), ...
+AREA_BANDS: List[float] = [50, 100, 200, 500]
+# Минимальное число объявлений в корзине, чтобы медиана имела смысл
+MIN_SAMPLES = 5
+CURRENCIES = ("byn", "usd")
+# Части адреса, которые обозначают улицу, а не населённый пункт
+STREET_PATTERN = re.compile(
+    r'(^|\s)(ул|улица|пр|пр-т|просп|проспект|пер|переулок|б-р|бульвар|тракт|ш|шоссе|пл|площадь|'
+    r'наб|набережная|проезд|мкр|микрорайон|туп|тупик)\.?(\s|$)',
+    re.IGNORECASE
+)
+HOUSE_NUMBER_PATTERN = re.compile(r'^(д\.?\s*)?\d', re.IGNORECASE)
+
+
+class QuantileDigest:
+    """
+    Потоковая оценка квантилей (упрощённый merging t-digest).
+
+    Хранит центроиды вместо самих значений: их число растёт медленно
+    (при compression=100 — несколько сотен на сотни тысяч значений).
+    """
+
+    def __init__(self, compression: int = 100, centroids: Optional[List[List[float]]] = None, count: float = 0):
+        self.compression = compression
+        self._centroids: List[List[float]] = centroids or []  # [mean, weight]
+        self._buffer: List[List[float]] = []  # [value, weight]
+        self.count = count
+
+    def add(self, value: float, weight: float = 1.0):
+        self._buffer.append([value, weight])
+        self.count += weight
+        if len(self._buffer) >= self.compression:
+            self._compress()
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        points = self._centroids + self._buffer
+        points.sort(key=lambda c: c[0])
+        self._buffer = []
+
+        total = sum(weight for _, weight in points)
+        merged: List[List[float]] = [list(points[0])]
+        cumulative = 0.0
+        for mean, weight in points[1:]:
+            last = merged[-1]
+            q = (cumulative + last[1] / 2) / total
+            # Классическое ограничение t-digest: центроиды у хвостов меньше, в середине крупнее
+            limit = max(1.0, 4 * total * q * (1 - q) / self.compression)
+            if last[1] + weight <= limit:
+                new_weight = last[1] + weight
+                last[0] += (mean - last[0]) * weight / new_weight
+                last[1] = new_weight
+            else:
+                cumulative += last[1]
+                merged.append([mean, weight])
+        self._centroids = merged
+
+    def quantile(self, q: float) -> Optional[float]:
+        self._compress()
+        if not self._centroids:
+            return None
+        if len(self._centroids) == 1:
+            return self._centroids[0][0]
+
+        total = sum(weight for _, weight in self._centroids)
+        target = q * total
+        cumulative = 0.0
+        previous_mid, previous_mean = None, None
+        for mean, weight in self._centroids:
+            mid = cumulative + weight / 2
+            if target <= mid:
+                if previous_mid is None:
+                    return mean
+                # Линейная интерполяция между серединами соседних центроидов
+                ratio = (target - previous_mid) / (mid - previous_mid)
+                return previous_mean + (mean - previous_mean) * ratio
+            previous_mid, previous_mean = mid, mean
+            cumulative += weight
+        return self._centroids[-1][0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        self._compress()
+        return {"compression": self.compression, "count": self.count, "centroids": self._centroids}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'QuantileDigest':
+        return cls(
+            compression=data.get("compression", 100),
+            centroids=[list(c) for c in data.get("centroids", [])],
+            count=data.get("count", 0)
+        )
+
+
+@dataclass
+class PriceContext:
+    percent: float  # > 0 — ниже медианы, < 0 — выше
+    median: float
+    currency: str
+    location: str
+    band: str
+    samples: int
+
+
+def _is_district(part: str) -> bool:
+    return "р-н" in part or "район" in part.lower()
+
+
+def _is_city(part: str) -> bool:
+    return not (
+        "обл" in part.lower()
+        or _is_district(part)
+        or STREET_PATTERN.search(part)
+        or HOUSE_NUMBER_PATTERN.match(part)
+        or any(char.isdigit() for char in part)
+    )
+
+
+def extract_location(address: str) -> str:
+    """
+    Определяет город (и район, если он указан) по адресу.
+    Возвращает пустую строку, если город в адресе не найден.
+
+    >>> extract_location("Янки Купалы ул, 3, Брест, Брестская обл.")
+    'Брест'
+    >>> extract_location("Минск, Фрунзенский р-н, Притыцкого ул, 29")
+    'Минск, Фрунзенский р-н'
+    >>> extract_location("Московская ул, 1, Брест")
+    'Брест'
+    >>> extract_location("Брест, Московская 202")
+    'Брест'
+    >>> extract_location("Брест, Советская")
+    'Брест'
+    """
+    parts = [part.strip() for part in (address or "").split(",") if part.strip()]
+
+    city = ""
+    for i, part in enumerate(parts):
+        if "обл" in part.lower() and i > 0 and _is_city(parts[i - 1]):
+            city = parts[i - 1]
+            break
+    if not city and parts and _is_city(parts[0]):
+        # Без области Kufar пишет город первым: "Брест, Советская"
+        city = parts[0]
+    if not city:
+        # Иначе берём последнюю часть, которая не похожа на улицу, номер дома или район
+        city = next((part for part in reversed(parts) if _is_city(part)), "")
+    if not city:
+        return ""
+
+    district = next((part for part in parts if _is_district(part)), None)
+    return f"{city}, {district}" if district else city
+
+
+def area_band(area: Optional[float]) -> str:
+    if area is None:
+        return "*"
+    lower = 0
+    for upper in AREA_BANDS:
+        if area < upper:
+            return f"{lower:g}–{upper:g} м²"
+        lower = upper
+    return f"{lower:g}+ м²"
+
+
+def listing_area(item: ListingItem) -> Optional[float]:
+    if item.area is not None:
+        return item.area
+    return extract_area_from_parameters(item.parameters) if item.parameters else None
+
+
+def price_per_meter(item: ListingItem) -> Dict[str, Optional[float]]:
+    area = listing_area(item)
+    result: Dict[str, Optional[float]] = {}
+    for currency in CURRENCIES:
+        total = extract_price_value(getattr(item.prices, currency))
+        result[currency] = total / area if total is not None and area else None
+    # Для BYN сайт сам показывает цену за м², если площадь не распознана
+    if result["byn"] is None:
+        result["byn"] = extract_price_value(item.prices.per_meter)
+    return result
+
+
+class MarketStatistics:
+    """
+    Инкрементальная статистика цен за м² по городу/району и диапазону площади.
+
+    Обновляется по мере поступления объявлений и сохраняется в отдельный файл,
+    поэтому медианы никогда не пересчитываются по всей истории.
+    """
+
+    def __init__(self, stats_file: str):
+        self._stats_path = Path(stats_file)
+        self._digests: Dict[str, Dict[str, QuantileDigest]] = {}
+        self._corrupted = False
+
+    @property
+    def exists(self) -> bool:
+        # Повреждённый файл считаем отсутствующим, чтобы start_parsing пересобрал статистику
+        return self._stats_path.exists() and not self._corrupted
+
+    def load(self):
+        if not self._stats_path.exists():
+            return
+        try:
+            with open(self._stats_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._digests = {
+                bucket: {currency: QuantileDigest.from_dict(digest) for currency, digest in digests.items()}
+                for bucket, digests in data.items()
+            }
+        except (OSError, ValueError, AttributeError) as e:
+            logger.error("Failed to load market statistics from %s, rebuilding: %s", self._stats_path, e)
+            self._digests = {}
+            self._corrupted = True
+            return
+        logger.info("Loaded market statistics for %d buckets from %s", len(self._digests), self._stats_path)
+
+    def save(self):
+        self._stats_path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            bucket: {currency: digest.to_dict() for currency, digest in digests.items()}
+            for bucket, digests in self._digests.items()
+        }
+        # Пишем во временный файл и подменяем, чтобы прерванная запись не оставила обрезанный JSON
+        tmp_path = self._stats_path.with_name(self._stats_path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self._stats_path)
+        self._corrupted = False
+
+    @staticmethod
+    def _buckets(item: ListingItem) -> Tuple[str, str]:
+        location = extract_location(item.address)
+        return f"{location}|{area_band(listing_area(item))}", f"{location}|*"
+
+    def add(self, item: ListingItem):
+        if not extract_location(item.address):
+            return
+        values = price_per_meter(item)
+        band_bucket, location_bucket = self._buckets(item)
+        for bucket in {band_bucket, location_bucket}:
+            digests = self._digests.setdefault(bucket, {})
+            for currency, value in values.items():
+                if value is not None:
+                    digests.setdefault(currency, QuantileDigest()).add(value)
+
+    def compare(self, item: ListingItem, currency: str = "byn") -> Optional[PriceContext]:
+        value = price_per_meter(item)[currency]
+        # Без распознанного города сравнивать не с чем
+        if value is None or not extract_location(item.address):
+            return None
+
+        # Сначала сравниваем с тем же диапазоном площади, затем со всем городом
+        for bucket in self._buckets(item):
+            digest = self._digests.get(bucket, {}).get(currency)
+            if digest is None or digest.count < MIN_SAMPLES:
+                continue
+            median = digest.quantile(0.5)
+            if not median:
+                continue
+            location, band = bucket.split("|", 1)
+            return PriceContext(
+                percent=(median - value) / median * 100,
+                median=median,
+                currency=currency,
+                location=location,
+                band=band if band != "*" else "все площади",
+                samples=int(digest.count)
+            )
+        return None
+
+
+def get_stats_file(storage_file: Optional[str] = None) -> str:
+    stats_file = os.getenv("STATS_FILE")
+    if stats_file:
+        return stats_file
+    if storage_file is None:
+        storage_file = os.getenv("STORAGE_FILE", "listings_data.json")
+    return str(Path(storage_file).with_name("market_stats.json"))
+
+
+def export_columnar(listings: List[Dict[str, Any]], output_file: str) -> str:
+    """
+    Экспортирует объявления в колоночный формат для векторного анализа.
+    .parquet требует pyarrow, любой другой путь сохраняется как сжатый .npz.
+    """
+    import numpy as np
+
+    items = [ListingItem.from_dict(listing) for listing in listings]
+    per_meter = [price_per_meter(item) for item in items]
+
+    def as_float(values):
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+    columns = {
+        "id": np.array([item.id for item in items], dtype=str),
+        "location": np.array([extract_location(item.address) for item in items], dtype=str),
+        "area": as_float(listing_area(item) for item in items),
+        "byn": as_float(extract_price_value(item.prices.byn) for item in items),
+        "usd": as_float(extract_price_value(item.prices.usd) for item in items),
+        "byn_per_m2": as_float(values["byn"] for values in per_meter),
+        "usd_per_m2": as_float(values["usd"] for values in per_meter),
+    }
+
+    output_path = Path(output_file)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_path.suffix == ".parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        pq.write_table(pa.table(columns), output_path)
+    else:
+        np.savez_compressed(output_path, **columns)
+        # np.savez_compressed добавляет .npz, если расширение не указано
+        if output_path.suffix != ".npz":
+            output_path = output_path.with_name(output_path.name + ".npz")
+
+    logger.info("Exported %d listings to %s", len(items), output_path)
+    return str(output_path)
+
+
+if __name__ == "__main__":
+    # python market_stats.py listings.npz  (или listings.parquet)
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    storage_file = os.getenv("STORAGE_FILE", "listings_data.json")
+    with open(storage_file, 'r', encoding='utf-8') as f:
+        export_columnar(json.load(f), sys.argv[1] if len(sys.argv) > 1 else "listings.npz")
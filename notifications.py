@@ -1,15 +1,33 @@
 from aiogram import Bot
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, Message
 from schema import ListingItem
 from extractor import extract_area_from_parameters
+from logger_config import logger
+from market_stats import MarketStatistics
+from photos import PhotoCache
+from typing import Optional, Union
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+# Фрагменты описаний ошибок Telegram, которые относятся к самому фото, а не к подписи
+PHOTO_ERROR_MARKERS = ("file identifier", "photo", "image", "file must be non-empty", "http url content", "web page content")
+
+
 class TelegramNotification:
-    def __init__(self, bot_token: str, chat_id: str):
+    def __init__(
+            self,
+            bot_token: str,
+            chat_id: str,
+            market_stats: Optional[MarketStatistics] = None,
+            photo_cache: Optional[PhotoCache] = None
+    ):
         self._bot = Bot(token=bot_token)
         self._chat_id = chat_id
+        self._market_stats = market_stats
+        self._photo_cache = photo_cache
 
     def _render_message(self, item: ListingItem) -> str:
         message = (
@@ -52,30 +70,93 @@ class TelegramNotification:
         if item.prices.per_meter:
             message += f"   За м²: {item.prices.per_meter}\n"
 
+        message += self._render_market_context(item)
+
         message += f"\n🔗 <a href='https://re.kufar.by/vi/brest/snyat/kommercheskaya/magaziny/{item.id}?searchId=5591851b475bb654ab25f35c6b40a1a72922'>Подробнее</a>"
 
         return message
 
-    async def send_notification(self, item: ListingItem):
+    def _render_market_context(self, item: ListingItem) -> str:
+        if self._market_stats is None:
+            return ""
+
+        lines = ""
+        for currency, label in (("byn", "р."), ("usd", "$")):
+            context = self._market_stats.compare(item, currency=currency)
+            if context is None:
+                continue
+            direction = "ниже" if context.percent >= 0 else "выше"
+            lines += (
+                f"   {abs(context.percent):.0f}% {direction} медианы "
+                f"({context.median:.2f} {label}/м², {context.location}, {context.band}, n={context.samples})\n"
+            )
+
+        return f"📊 Рынок:\n{lines}" if lines else ""
+
+    def _resolve_photo(self, url: str) -> Union[str, BufferedInputFile]:
+        """
+        Порядок: уже известный Telegram file_id, затем скачанные заранее байты,
+        и только если их нет — URL, по которому Telegram скачает фото сам.
+        """
+        if self._photo_cache is None:
+            return url
+
+        file_id = self._photo_cache.get_file_id(url)
+        if file_id:
+            return file_id
+
+        content = self._photo_cache.get_bytes(url)
+        if content is not None:
+            return BufferedInputFile(content, filename=url.rsplit("/", 1)[-1] or "photo.jpg")
+
+        return url
+
+    async def _send_photo(self, url: str, caption: str) -> Message:
+        photo = self._resolve_photo(url)
+        try:
+            sent = await self._bot.send_photo(
+                chat_id=self._chat_id,
+                photo=photo,
+                caption=caption,
+                parse_mode=ParseMode.HTML
+            )
+        except TelegramBadRequest as e:
+            from_cache = not (isinstance(photo, str) and photo == url)
+            photo_error = any(marker in e.message.lower() for marker in PHOTO_ERROR_MARKERS)
+            # Ошибки подписи (например, "can't parse entities") не связаны с кэшем — не трогаем его
+            if not from_cache or not photo_error:
+                raise
+            # Telegram не принял сохранённый file_id или байты из кэша — убираем их и отправляем по URL
+            logger.warning("Cached photo for %s was rejected, sending by URL: %s", url, e)
+            self._photo_cache.forget(url)
+            sent = await self._bot.send_photo(
+                chat_id=self._chat_id,
+                photo=url,
+                caption=caption,
+                parse_mode=ParseMode.HTML
+            )
+
+        if self._photo_cache is not None and sent.photo:
+            self._photo_cache.remember_file_id(url, sent.photo[-1].file_id)
+        return sent
+
+    async def send_notification(self, item: ListingItem) -> bool:
         message = self._render_message(item)
 
         try:
             if item.photo_url:
-                await self._bot.send_photo(
-                    chat_id=self._chat_id,
-                    photo=item.photo_url,
-                    caption=message,
-                    parse_mode=ParseMode.HTML
-                )
+                await self._send_photo(item.photo_url, message)
             else:
                 await self._bot.send_message(
                     chat_id=self._chat_id,
                     text=message,
                     parse_mode=ParseMode.HTML
                 )
-            print(f"Notification sent for listing {item.id}")
+            logger.info("Notification sent for listing %s", item.id)
+            return True
         except Exception as e:
-            print(f"Failed to send notification for listing {item.id}: {str(e)}")
+            logger.error("Failed to send notification for listing %s: %s", item.id, e)
+            return False
 
     async def send_error(self, err: str):
         try:
@@ -85,9 +166,9 @@ class TelegramNotification:
                 text=error_message,
                 parse_mode=ParseMode.HTML
             )
-            print(f"Error notification sent: {err}")
+            logger.info("Error notification sent: %s", err)
         except Exception as e:
-            print(f"Failed to send error notification: {str(e)}")
+            logger.error("Failed to send error notification: %s", e)
 
     async def close(self):
         await self._bot.close()
@@ -110,7 +191,7 @@ class EmailNotification:
         """
         return message
 
-    async def send_notification(self, item: ListingItem):
+    async def send_notification(self, item: ListingItem) -> bool:
         subject = item.address
         html_content = self._render_message(item)
 
@@ -128,9 +209,11 @@ class EmailNotification:
                 server.login(self._sender_email, self._sender_password)
                 server.sendmail(self._sender_email, self._recipient_email, message.as_string())
 
-            print(f"Email notification sent for listing {item.id}")
+            logger.info("Email notification sent for listing %s", item.id)
+            return True
         except Exception as e:
-            print(f"Failed to send email notification for listing {item.id}: {str(e)}")
+            logger.error("Failed to send email notification for listing %s: %s", item.id, e)
+            return False
 
     async def send_error(self, err: str):
         subject = "Ошибка в приложении Kufar"
@@ -153,9 +236,9 @@ class EmailNotification:
                 server.login(self._sender_email, self._sender_password)
                 server.sendmail(self._sender_email, self._recipient_email, message.as_string())
 
-            print(f"Error email notification sent: {err}")
+            logger.info("Error email notification sent: %s", err)
         except Exception as e:
-            print(f"Failed to send error email notification: {str(e)}")
+            logger.error("Failed to send error email notification: %s", e)
 
     async def close(self):
         # No need to close anything for email, but keeping the method for consistency
@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Dict, Optional
+
+import httpx
+
+from data import USER_AGENTS
+from logger_config import logger
+
+
+class PhotoCache:
+    """
+    Дисковый LRU-кэш фотографий объявлений и Telegram file_id для них.
+
+    Файлы хранятся по хэшу содержимого, поэтому одинаковые фото у
+    перевыставленных объявлений загружаются в Telegram только один раз.
+    Порядок использования файлов и их суммарный размер ведутся в памяти,
+    при старте они восстанавливаются по mtime. Индекс хранит не больше
+    max_file_ids file_id и только те URL, для которых есть файл или file_id.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, concurrency: int = 4, max_file_ids: int = 5000):
+        self._cache_dir = Path(cache_dir)
+        self._index_path = self._cache_dir / "index.json"
+        self._max_bytes = max_bytes
+        self._max_file_ids = max_file_ids
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._urls: Dict[str, str] = {}  # url -> content hash
+        self._file_ids: Dict[str, str] = {}  # content hash -> Telegram file_id
+        self._files: "OrderedDict[str, int]" = OrderedDict()  # content hash -> size, от давно использованных к недавним
+        self._total_bytes = 0
+
+    def load(self):
+        self._scan_files()
+        if not self._index_path.exists():
+            return
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            urls, file_ids = dict(data.get("urls", {})), dict(data.get("file_ids", {}))
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            # Индекс — всего лишь кэш, повреждённый можно просто начать заново
+            logger.error("Failed to load photo cache index from %s, starting empty: %s", self._index_path, e)
+            return
+        self._urls, self._file_ids = urls, file_ids
+        logger.info("Loaded photo cache index with %d file ids from %s", len(self._file_ids), self._index_path)
+
+    def _scan_files(self):
+        try:
+            files = [(path, path.stat()) for path in self._cache_dir.glob("*.jpg")]
+        except OSError as e:
+            logger.error("Failed to scan photo cache %s: %s", self._cache_dir, e)
+            return
+        self._files = OrderedDict(
+            (path.stem, stat.st_size) for path, stat in sorted(files, key=lambda entry: entry[1].st_mtime)
+        )
+        self._total_bytes = sum(self._files.values())
+
+    def save(self):
+        try:
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            # Пишем во временный файл и подменяем, чтобы прерванная запись не оставила обрезанный JSON
+            tmp_path = self._index_path.with_name(self._index_path.name + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"urls": self._urls, "file_ids": self._file_ids}, f, ensure_ascii=False)
+            os.replace(tmp_path, self._index_path)
+        except OSError as e:
+            logger.error("Failed to save photo cache index to %s: %s", self._index_path, e)
+
+    def _photo_path(self, content_hash: str) -> Path:
+        return self._cache_dir / f"{content_hash}.jpg"
+
+    def get_file_id(self, url: str) -> Optional[str]:
+        content_hash = self._urls.get(url)
+        file_id = self._file_ids.pop(content_hash, None) if content_hash else None
+        if file_id:
+            # Переставляем в конец, чтобы при вытеснении удалялись давно не использованные
+            self._file_ids[content_hash] = file_id
+        return file_id
+
+    def remember_file_id(self, url: str, file_id: str):
+        # Если фото не удалось скачать заранее, file_id запоминается по хэшу URL
+        content_hash = self._urls.setdefault(url, "url-" + hashlib.sha256(url.encode()).hexdigest())
+        self._file_ids.pop(content_hash, None)
+        self._file_ids[content_hash] = file_id
+        while len(self._file_ids) > self._max_file_ids:
+            self._file_ids.pop(next(iter(self._file_ids)))
+
+    def forget(self, url: str):
+        """Удаляет file_id и файл фото, которые Telegram не принял."""
+        content_hash = self._urls.pop(url, None)
+        if not content_hash:
+            return
+        self._file_ids.pop(content_hash, None)
+        self._remove_file(content_hash)
+
+    def _touch(self, content_hash: str) -> bool:
+        """Отмечает файл как недавно использованный. False, если файла на диске уже нет."""
+        try:
+            # mtime нужен, чтобы восстановить порядок использования после перезапуска
+            os.utime(self._photo_path(content_hash))
+        except FileNotFoundError:
+            self._total_bytes -= self._files.pop(content_hash, 0)
+            return False
+        if content_hash in self._files:
+            self._files.move_to_end(content_hash)
+        return True
+
+    def _remove_file(self, content_hash: str):
+        self._total_bytes -= self._files.pop(content_hash, 0)
+        try:
+            self._photo_path(content_hash).unlink(missing_ok=True)
+        except OSError as e:
+            logger.error("Failed to remove cached photo %s: %s", content_hash, e)
+
+    def get_bytes(self, url: str) -> Optional[bytes]:
+        content_hash = self._urls.get(url)
+        if not content_hash:
+            return None
+        path = self._photo_path(content_hash)
+        if not self._touch(content_hash):
+            return None
+        try:
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    async def prefetch(self, session: httpx.AsyncClient, urls: List[str]):
+        """Параллельно скачивает фото, которых ещё нет ни на диске, ни в Telegram."""
+        pending = [
+            url for url in dict.fromkeys(urls)
+            if url and not self.get_file_id(url) and not self._has_photo(url)
+        ]
+        if not pending:
+            return
+
+        results = await asyncio.gather(*(self._download(session, url) for url in pending))
+        logger.info("Prefetched %d of %d photos", sum(results), len(pending))
+        self._evict()
+
+    def _has_photo(self, url: str) -> bool:
+        content_hash = self._urls.get(url)
+        return content_hash is not None and content_hash in self._files
+
+    async def _download(self, session: httpx.AsyncClient, url: str) -> bool:
+        async with self._semaphore:
+            try:
+                response = await session.get(url, headers={"User-Agent": USER_AGENTS[0]}, follow_redirects=True)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.error("Failed to prefetch photo %s: %s", url, e)
+                return False
+
+        content = response.content
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = self._photo_path(content_hash)
+        try:
+            # Если то же изображение уже есть, только отмечаем его как недавно использованное
+            if not (content_hash in self._files and self._touch(content_hash)):
+                self._cache_dir.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(content)
+                self._files[content_hash] = len(content)
+                self._total_bytes += len(content)
+        except OSError as e:
+            logger.error("Failed to cache photo %s: %s", url, e)
+            return False
+        self._urls[url] = content_hash
+        return True
+
+    def _evict(self):
+        # Удаляем самые давно использованные файлы, пока не уложимся в лимит
+        while self._total_bytes > self._max_bytes and self._files:
+            self._remove_file(next(iter(self._files)))
+
+        # URL без файла и без file_id больше ничего не дают — убираем их из индекса
+        self._urls = {
+            url: content_hash for url, content_hash in self._urls.items()
+            if content_hash in self._files or content_hash in self._file_ids
+        }
+
+
+def get_photo_cache(storage_file: Optional[str] = None) -> PhotoCache:
+    if storage_file is None:
+        storage_file = os.getenv("STORAGE_FILE", "listings_data.json")
+    cache_dir = os.getenv("PHOTO_CACHE_DIR", str(Path(storage_file).with_name("photos")))
+    return PhotoCache(
+        cache_dir=cache_dir,
+        max_bytes=int(os.getenv("PHOTO_CACHE_MAX_MB", "200")) * 1024 * 1024,
+        concurrency=int(os.getenv("PHOTO_PREFETCH_CONCURRENCY", "4")),
+        max_file_ids=int(os.getenv("PHOTO_CACHE_MAX_FILE_IDS", "5000")),
+    )
@@ -7,6 +7,7 @@ import httpx
 from data import URL
 from extractor import extract_all_listings_data
 from logger_config import logger
+from tracing import tracer
 
 
 def transform_address_parameters(address: str, parameters: str) -> str:
@@ -29,35 +30,45 @@ async def update_offers(session: httpx.AsyncClient, storage_file: str = None) ->
     storage_path.parent.mkdir(parents=True, exist_ok=True)
 
     # Load existing data
-    if storage_path.exists():
-        with open(storage_path, 'r', encoding='utf-8') as f:
-            existing_data = json.load(f)
-    else:
-        existing_data = []
-
-    existing_parameters_addresses = set(
-        transform_item(item=item)
-        for item in existing_data
-    )
+    with tracer.span("load") as span:
+        if storage_path.exists():
+            with open(storage_path, 'r', encoding='utf-8') as f:
+                existing_data = json.load(f)
+        else:
+            existing_data = []
+        span["listings"] = len(existing_data)
 
     # Download the latest page using the provided session
-    response = await session.get(URL)
-    html_content = response.text
+    with tracer.span("fetch", url=URL) as span:
+        response = await session.get(URL)
+        html_content = response.text
+        span["status_code"] = response.status_code
+        span["bytes"] = len(response.content)
 
     # Extract listings from the new page
-    new_listings = extract_all_listings_data(html_content)
+    with tracer.span("parse") as span:
+        new_listings = extract_all_listings_data(html_content)
+        span["listings"] = len(new_listings)
 
     # Check for new offers
-    new_offers = []
-    for offer in new_listings:
-        if transform_item(offer) not in existing_parameters_addresses:
-            new_offers.append(offer)
-            logger.info(f"New offer found: {offer}")
-            existing_data.append(offer)
+    with tracer.span("dedup") as span:
+        existing_parameters_addresses = set(
+            transform_item(item=item)
+            for item in existing_data
+        )
+
+        new_offers = []
+        for offer in new_listings:
+            if transform_item(offer) not in existing_parameters_addresses:
+                new_offers.append(offer)
+                logger.info("New offer found: %s", offer.get("id"), extra={"offer": offer})
+                existing_data.append(offer)
+        span["new_offers"] = len(new_offers)
 
     # Update the storage file with new data
-    with open(storage_path, 'w', encoding='utf-8') as f:
-        json.dump(existing_data, f, ensure_ascii=False, indent=2)
+    with tracer.span("persist", listings=len(existing_data)):
+        with open(storage_path, 'w', encoding='utf-8') as f:
+            json.dump(existing_data, f, ensure_ascii=False, indent=2)
 
-    logger.info(f"Updated storage file with {len(new_offers)} new offers.")
+    logger.info("Updated storage file with %d new offers.", len(new_offers))
     return new_offers
@@ -0,0 +1,201 @@
+import atexit
+import cProfile
+import json
+import logging
+import os
+import queue
+import signal
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler, QueueListener
+from pathlib import Path
+from typing import List, Dict, Optional, Any, Awaitable
+
+from dotenv import load_dotenv
+
+from logger_config import logger, LazyQueueHandler
+
+load_dotenv()
+
+_current_trace_id: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+_current_span_id: ContextVar[Optional[str]] = ContextVar("span_id", default=None)
+
+
+class SpanFormatter(logging.Formatter):
+    """Сериализует спан (dict в record.msg) в JSON-строку уже в потоке QueueListener."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, ensure_ascii=False, default=str)
+
+
+class Tracer:
+    """
+    Минимальный трейсер: спаны вокруг этапов цикла опроса.
+
+    Каждый спан — одна JSON-строка с trace_id/span_id/parent_span_id и
+    длительностью. Это простой JSONL, а не формат OTLP. Спаны пишутся через
+    очередь, как и логи в logger_config, а файл ротируется по размеру так же,
+    как error.log.
+    """
+
+    def __init__(self, trace_file: Optional[str], max_bytes: int = 5 * 1024 * 1024, backup_count: int = 5):
+        self._trace_path = Path(trace_file) if trace_file else None
+        self._pending: List[Dict[str, Any]] = []
+        self._span_logger: Optional[logging.Logger] = None
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+
+    @property
+    def enabled(self) -> bool:
+        return self._trace_path is not None
+
+    @contextmanager
+    def cycle(self, **attributes):
+        """Корневой спан цикла опроса. Спаны записываются в файл по его завершении."""
+        trace_token = _current_trace_id.set(uuid.uuid4().hex)
+        try:
+            with self.span("cycle", **attributes):
+                yield
+        finally:
+            _current_trace_id.reset(trace_token)
+            self.flush()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            yield attributes
+            return
+
+        trace_id = _current_trace_id.get() or uuid.uuid4().hex
+        span_id = uuid.uuid4().hex[:16]
+        parent_span_id = _current_span_id.get()
+        span_token = _current_span_id.set(span_id)
+        status = "ok"
+        start_ns = time.time_ns()
+        start = time.perf_counter()
+        try:
+            # Атрибуты можно дополнять внутри спана: with tracer.span(...) as attrs: attrs["count"] = 1
+            yield attributes
+        except BaseException as e:
+            attributes["error"] = repr(e)
+            raise
+        finally:
+            if "error" in attributes:
+                status = "error"
+            duration_ns = int((time.perf_counter() - start) * 1e9)
+            _current_span_id.reset(span_token)
+            self._pending.append({
+                "name": name,
+                "trace_id": trace_id,
+                "span_id": span_id,
+                "parent_span_id": parent_span_id,
+                "start_time_unix_nano": start_ns,
+                "end_time_unix_nano": start_ns + duration_ns,
+                "duration_ms": round(duration_ns / 1e6, 3),
+                "status": status,
+                "attributes": attributes,
+            })
+            if parent_span_id is None and _current_trace_id.get() is None:
+                # Спан вне цикла — записываем сразу
+                self.flush()
+
+    async def wrap(self, name: str, awaitable: Awaitable, **attributes) -> Any:
+        """Спан вокруг корутины. Результат False (например, от send_notification) помечает спан как ошибку."""
+        with self.span(name, **attributes) as span:
+            result = await awaitable
+            if result is False:
+                span["error"] = f"{name} failed"
+            return result
+
+    def _get_span_logger(self) -> logging.Logger:
+        if self._span_logger is None:
+            self._trace_path.parent.mkdir(parents=True, exist_ok=True)
+            file_handler = RotatingFileHandler(
+                filename=self._trace_path,
+                maxBytes=self._max_bytes,
+                backupCount=self._backup_count,
+                encoding='utf-8',
+                delay=True
+            )
+            file_handler.setFormatter(SpanFormatter())
+
+            span_queue = queue.SimpleQueue()
+            listener = QueueListener(span_queue, file_handler)
+            listener.start()
+            atexit.register(listener.stop)
+
+            span_logger = logging.getLogger(f"{__name__}.spans")
+            span_logger.setLevel(logging.INFO)
+            span_logger.propagate = False
+            span_logger.addHandler(LazyQueueHandler(span_queue))
+            self._span_logger = span_logger
+        return self._span_logger
+
+    def flush(self):
+        if not self._pending or not self.enabled:
+            return
+        spans, self._pending = self._pending, []
+        try:
+            span_logger = self._get_span_logger()
+        except OSError as e:
+            logger.error("Failed to create trace directory for %s: %s", self._trace_path, e)
+            return
+        for span in spans:
+            # Сериализация и запись в файл происходят в потоке QueueListener
+            span_logger.info(span)
+
+
+class CycleProfiler:
+    """
+    Профилирование следующих N циклов через cProfile.
+
+    Включается переменной PROFILE_CYCLES при старте или сигналом SIGUSR1
+    во время работы (kill -USR1 <pid>). Результат — .prof файлы, которые
+    открываются в snakeviz или превращаются во flamegraph через flameprof.
+    """
+
+    def __init__(self, output_dir: str, cycles: int = 0, signal_cycles: int = 1):
+        self._output_dir = Path(output_dir)
+        self._remaining = cycles
+        self._signal_cycles = signal_cycles
+
+    def request(self, cycles: int):
+        self._remaining = max(self._remaining, cycles)
+        logger.info("Profiling armed for the next %d cycle(s)", self._remaining)
+
+    def install_signal_handler(self):
+        # SIGUSR1 нет в Windows
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.request(self._signal_cycles))
+
+    @contextmanager
+    def cycle(self):
+        if self._remaining <= 0:
+            yield
+            return
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._remaining -= 1
+            self._output_dir.mkdir(parents=True, exist_ok=True)
+            output_path = self._output_dir / f"cycle-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}.prof"
+            profile.dump_stats(output_path)
+            logger.info("Cycle profile saved to %s (%d cycle(s) left)", output_path, self._remaining)
+
+
+tracer = Tracer(
+    os.getenv("TRACE_FILE", os.path.join("logs", "traces.jsonl"))
+    if os.getenv("ENABLE_TRACING", "true").lower() == "true" else None,
+    max_bytes=int(os.getenv("TRACE_FILE_MAX_MB", "5")) * 1024 * 1024,
+)
+profiler = CycleProfiler(
+    output_dir=os.getenv("PROFILE_DIR", os.path.join("logs", "profiles")),
+    cycles=int(os.getenv("PROFILE_CYCLES", "0")),
+    signal_cycles=int(os.getenv("PROFILE_SIGNAL_CYCLES", "1")),
+)